@@ -5,15 +5,24 @@ Analyzes population density in drone flight areas using IBGE data.
 
 import os
 import argparse
+import functools
+import gc
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import zipfile
 import io
 import geopandas as gpd
+import shapely
+from shapely.ops import transform as shapely_transform
+from pyproj import Transformer
 import matplotlib.pyplot as plt
 import contextily as cx
 import pandas as pd
 from matplotlib.patches import Patch
-from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.colors import LinearSegmentedColormap, Normalize
+from matplotlib.collections import PolyCollection
+from matplotlib.cm import ScalarMappable
 import numpy as np
 
 
@@ -41,19 +50,83 @@ DEFAULT_BUFFER_INFO = {
     'Adjacent Area': {'buffer': 5000, 'height': None},  # 5km
 }
 
+# pyogrio reads whole layers as Arrow/NumPy buffers in C instead of
+# iterating features in Python; prefer it when installed
+try:
+    import pyogrio  # noqa: F401
+    _IO_ENGINE = 'pyogrio'
+except ImportError:
+    _IO_ENGINE = 'fiona'
+
 ALBERS_BR = (
     "+proj=aea +lat_0=-12 +lon_0=-54 +lat_1=-2 +lat_2=-22 "
     "+x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs"
 )
 
-# Cache for loaded grids
+# Built once: PROJ parses the +proj string and sets up the pipeline on every
+# Transformer construction, and polygon areas are measured many times per run
+_WGS84_TO_ALBERS = Transformer.from_crs('EPSG:4326', ALBERS_BR, always_xy=True)
+
+# Cache for loaded grids (insertion-ordered, evicted LRU-style so a run
+# touching many quadrants cannot pin hundreds of MB of cells in memory).
+# prefetch_grids fills it from several threads, so mutations take the lock.
 _GRID_CACHE = {}
+_GRID_CACHE_MAX = 8
+_GRID_CACHE_LOCK = threading.Lock()
 _QUADRANT_INDEX = None
 
+# Shared HTTP session so IBGE downloads reuse TCP/TLS connections
+_HTTP_SESSION = None
+
+
+def _http_session():
+    """Build the shared requests session on first use."""
+    global _HTTP_SESSION
+
+    if _HTTP_SESSION is None:
+        _HTTP_SESSION = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        _HTTP_SESSION.mount('https://', adapter)
+
+    return _HTTP_SESSION
+
+# Translation table for pt-BR thousands separator (C-level table lookup,
+# cheaper than a str.replace scan per formatted number)
+_COMMA_DOT = str.maketrans({',': '.'})
+
+
+def _read_grid_shapefile(shp_path):
+    """
+    Load a grid, preferring a GeoParquet copy kept next to the shapefile.
+
+    Parquet is columnar and skips OGR's DBF/SHX parsing, so repeat runs
+    load several times faster. The copy is written on first load; when
+    pyarrow is unavailable the shapefile path keeps working.
+    """
+    parquet_path = os.path.splitext(shp_path)[0] + '.parquet'
+
+    if os.path.exists(parquet_path):
+        try:
+            return gpd.read_parquet(parquet_path)
+        except Exception as e:
+            print(f"  ⚠ Could not read parquet cache ({e}); using shapefile")
+
+    dados = gpd.read_file(shp_path, engine=_IO_ENGINE)
+
+    try:
+        dados.to_parquet(parquet_path)
+    except Exception:
+        pass  # pyarrow not installed; shapefile remains the source
+
+    return dados
+
 
 def extrair_layers_kml(kml_filename, layer_names):
     """Extract and union geometries from KML layers."""
-    gdf = gpd.read_file(kml_filename, driver='KML')
+    if _IO_ENGINE == 'pyogrio':
+        gdf = gpd.read_file(kml_filename, engine='pyogrio')
+    else:
+        gdf = gpd.read_file(kml_filename, driver='KML')
     layers_poligonos = {}
     
     for name in layer_names:
@@ -62,12 +135,16 @@ def extrair_layers_kml(kml_filename, layer_names):
             print(f"⚠ Layer '{name}' not found in KML.")
             continue
         
-        sel = sel[sel.geometry.type.isin(['Polygon', 'MultiPolygon'])]
-        if sel.empty:
+        # Vectorized type filter + union: get_type_id and unary_union run
+        # over the geometry array in C (3 = Polygon, 6 = MultiPolygon)
+        geoms = sel.geometry.values
+        type_ids = shapely.get_type_id(geoms)
+        geoms = geoms[(type_ids == 3) | (type_ids == 6)]
+        if len(geoms) == 0:
             print(f"⚠ Layer '{name}' has no polygons.")
             continue
-        
-        layers_poligonos[name] = sel.geometry.union_all()
+
+        layers_poligonos[name] = shapely.unary_union(geoms)
         print(f"✓ Layer '{name}' extracted.")
     
     return layers_poligonos
@@ -91,7 +168,7 @@ def carregar_indice_quadrantes():
         os.makedirs(pasta, exist_ok=True)
         print("⬇ Downloading 500km grid index (one-time operation)...")
         try:
-            resp = requests.get(url, timeout=60)
+            resp = _http_session().get(url, timeout=60)
             resp.raise_for_status()
             with zipfile.ZipFile(io.BytesIO(resp.content)) as z:
                 z.extractall(pasta)
@@ -100,7 +177,7 @@ def carregar_indice_quadrantes():
             return None
     
     # Load and convert to WGS84 for easy intersection with KML polygons
-    _QUADRANT_INDEX = gpd.read_file(shp_path).to_crs(epsg=4326)
+    _QUADRANT_INDEX = _read_grid_shapefile(shp_path).to_crs(epsg=4326)
     print(f"✓ Quadrant index loaded: {len(_QUADRANT_INDEX)} cells")
     return _QUADRANT_INDEX
 
@@ -124,10 +201,12 @@ def identificar_grades_relevantes(area_geom):
         print(f"  Polygon bounds: {area_geom.bounds}")
         return []
     
-    # Extract unique QUADRANTE values (these correspond to grade_id numbers)
-    grades_raw = sorted(intersecting['QUADRANTE'].unique().tolist())
-    grades_relevantes = [int(g.replace("ID_", "")) for g in grades_raw]
-    
+    # Extract unique QUADRANTE values (these correspond to grade_id numbers);
+    # the prefix strip and int conversion run as column-vectorized kernels
+    grades_relevantes = np.sort(
+        intersecting['QUADRANTE'].str.removeprefix('ID_').astype(np.int32).unique()
+    ).tolist()
+
     return grades_relevantes
 
 
@@ -139,8 +218,13 @@ def carregar_grid_ibge(grade_id, use_cache=True):
     - Mixed resolution: 1km x 1km (rural) and 200m x 200m (urban)
     - Albers Equal Area projection (SIRGAS2000)
     """
-    if use_cache and grade_id in _GRID_CACHE:
-        return _GRID_CACHE[grade_id], grade_id
+    if use_cache:
+        with _GRID_CACHE_LOCK:
+            dados = _GRID_CACHE.pop(grade_id, None)
+            if dados is not None:
+                # Re-insert so dict order tracks recency of use
+                _GRID_CACHE[grade_id] = dados
+                return dados, grade_id
     
     url = f"https://geoftp.ibge.gov.br/recortes_para_fins_estatisticos/grade_estatistica/censo_2022/grade_estatistica/grade_id{grade_id}.zip"
     pasta = f"dados_ibge/grade_id{grade_id}"
@@ -150,7 +234,7 @@ def carregar_grid_ibge(grade_id, use_cache=True):
         os.makedirs(pasta, exist_ok=True)
         print(f"  ⬇ Downloading grade_id{grade_id}...")
         try:
-            resp = requests.get(url, timeout=30)
+            resp = _http_session().get(url, timeout=30)
             resp.raise_for_status()
             with zipfile.ZipFile(io.BytesIO(resp.content)) as z:
                 z.extractall(pasta)
@@ -158,18 +242,45 @@ def carregar_grid_ibge(grade_id, use_cache=True):
             print(f"  ✗ Error downloading grade_id{grade_id}: {e}")
             return None, grade_id
     
-    dados = gpd.read_file(shp_path)
-    
+    dados = _read_grid_shapefile(shp_path)
+
     if use_cache:
-        _GRID_CACHE[grade_id] = dados
-    
+        with _GRID_CACHE_LOCK:
+            _GRID_CACHE[grade_id] = dados
+            while len(_GRID_CACHE) > _GRID_CACHE_MAX:
+                _GRID_CACHE.pop(next(iter(_GRID_CACHE)))
+
     return dados, grade_id
 
 
+def prefetch_grids(grades_relevantes):
+    """
+    Load the given IBGE grids in parallel, filling _GRID_CACHE.
+
+    Downloads are network-bound and independent, so running them on a
+    thread pool collapses the wallclock to the slowest grid instead of
+    the sum of all of them. Grids already cached are skipped.
+    """
+    faltantes = [g for g in grades_relevantes if g not in _GRID_CACHE]
+
+    if not faltantes:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(8, len(faltantes))) as executor:
+        list(executor.map(carregar_grid_ibge, faltantes))
+
+
+@functools.lru_cache(maxsize=32)
 def calcular_area_km2(geom):
-    """Calculate area in km² for a geometry in WGS84."""
-    geom_projected = gpd.GeoSeries([geom], crs='EPSG:4326').to_crs(ALBERS_BR)
-    return float(geom_projected.area.iloc[0] / 1e6)
+    """
+    Calculate area in km² for a geometry in WGS84.
+
+    Memoized: shapely 2 geometries are immutable and hashable, and the same
+    layer polygons are measured repeatedly per run (map sizing, statistics),
+    so each one pays the PROJ transform exactly once.
+    """
+    geom_projected = shapely_transform(_WGS84_TO_ALBERS.transform, geom)
+    return float(shapely.area(geom_projected) / 1e6)
 
 
 def desenhar_contornos(ax, layers_poligonos, layer_order):
@@ -246,7 +357,8 @@ def calcular_estatisticas(dados_intersec, area_geom=None):
     Calculate statistics from filtered grid.
     
     Args:
-        dados_intersec: GeoDataFrame with population data in metric projection
+        dados_intersec: GeoDataFrame with population data; when present the
+                        precomputed 'area_km2' column is used for cell areas
         area_geom: Optional - actual polygon geometry to use for area calculation
     
     Returns:
@@ -259,11 +371,12 @@ def calcular_estatisticas(dados_intersec, area_geom=None):
     
     # Use actual polygon area if provided, otherwise sum of cell areas
     if area_geom is not None:
-        # Convert to metric projection and calculate area
-        area_geom_projected = gpd.GeoSeries([area_geom], crs='EPSG:4326').to_crs(ALBERS_BR)
-        area_km2 = float(area_geom_projected.area.iloc[0] / 1e6)
+        # Memoized; reuses the transform already done for map sizing
+        area_km2 = calcular_area_km2(area_geom)
+    elif 'area_km2' in dados_intersec.columns:
+        area_km2 = float(dados_intersec['area_km2'].sum())
     else:
-        area_km2 = float((dados_intersec.geometry.area.sum()) / 1e6)
+        area_km2 = float(shapely.area(dados_intersec.geometry.values).sum() / 1e6)
     
     densidade_media = (total_pessoas / area_km2) if area_km2 > 0 else 0.0
     densidade_maxima = float(dados_intersec['densidade_pop_km2'].max()) if not dados_intersec.empty else 0.0
@@ -271,11 +384,15 @@ def calcular_estatisticas(dados_intersec, area_geom=None):
     return total_pessoas, area_km2, densidade_media, densidade_maxima
 
 
-def processar_todas_grades(area_geom, titulo, layers_poligonos, layers_para_mostrar, 
-                          buffer_info=None, output_path=None):
+def processar_todas_grades(area_geom, titulo, layers_poligonos, layers_para_mostrar,
+                          buffer_info=None, output_path=None, return_png=False):
     """
     Process all relevant IBGE grids and create a single combined map.
     Uses 500km grid as spatial index to identify relevant quadrants.
+
+    When return_png is True the rendered map is also returned in-memory
+    under the 'png_buffer' key, so the PDF generator can embed it without
+    re-reading (and re-decoding) the PNG from disk.
     """
     print(f"\n{'='*60}")
     print(f"Processing: {titulo}")
@@ -289,7 +406,10 @@ def processar_todas_grades(area_geom, titulo, layers_poligonos, layers_para_most
         return None
     
     print(f"✓ Identified {len(grades_relevantes)} relevant quadrants: {grades_relevantes}")
-    
+
+    # Download/load any missing grids in parallel before the sequential pass
+    prefetch_grids(grades_relevantes)
+
     # Collect data from all relevant grids
     todos_dados = []
     
@@ -299,18 +419,17 @@ def processar_todas_grades(area_geom, titulo, layers_poligonos, layers_para_most
         if grid is None:
             continue
         
-        # Use spatial index for fast filtering
+        # Single predicate-aware query on the grid's STRtree: the tree prunes
+        # by bounds and refines with the intersects test in one C call,
+        # replacing the old bounds query + per-row intersects pass
         try:
-            possible_matches_idx = list(grid.sindex.intersection(area_geom.bounds))
-            if not possible_matches_idx:
+            idx = grid.sindex.query(area_geom, predicate='intersects')
+            if len(idx) == 0:
                 continue
-            
-            possible_matches = grid.iloc[possible_matches_idx]
-            dados_filtrados = possible_matches[possible_matches.intersects(area_geom)].copy()
-            
-            if not dados_filtrados.empty:
-                print(f"  ✓ grade_id{grade_id}: {len(dados_filtrados)} cells found")
-                todos_dados.append(dados_filtrados)
+
+            dados_filtrados = grid.iloc[idx].copy()
+            print(f"  ✓ grade_id{grade_id}: {len(dados_filtrados)} cells found")
+            todos_dados.append(dados_filtrados)
         except Exception as e:
             print(f"  ✗ grade_id{grade_id}: Error - {e}")
             continue
@@ -319,15 +438,27 @@ def processar_todas_grades(area_geom, titulo, layers_poligonos, layers_para_most
         print("⚠ No data found in any grid for this area.")
         return None
     
-    # Combine all data
-    dados_combinados = gpd.GeoDataFrame(pd.concat(todos_dados, ignore_index=True))
+    # Combine all data; the single-grade case (the common one for small
+    # areas) skips concat entirely. Under pandas' copy-on-write, concat
+    # already shares the per-grade column blocks lazily.
+    if len(todos_dados) == 1:
+        dados_combinados = todos_dados[0]
+    else:
+        dados_combinados = gpd.GeoDataFrame(
+            pd.concat(todos_dados, ignore_index=True)
+        )
     print(f"✓ Total cells: {len(dados_combinados)}")
     
-    # Calculate density in metric projection
-    dados_area = dados_combinados.to_crs(ALBERS_BR)
-    dados_area['area_km2'] = dados_area.geometry.area / 1e6
-    dados_area['densidade_pop_km2'] = dados_area['TOTAL'] / dados_area['area_km2']
-    dados_combinados['densidade_pop_km2'] = dados_area['densidade_pop_km2'].values
+    # Calculate density in the metric projection; shapely.area runs over the
+    # whole geometry array in one C call instead of per-cell dispatch. Only
+    # the geometry column is reprojected — the attribute columns stay on the
+    # WGS84 frame used for plotting, so no second copy of the data is made
+    geoms_albers = dados_combinados.geometry.to_crs(ALBERS_BR)
+    areas_m2 = shapely.area(geoms_albers.values)
+    dados_combinados['area_km2'] = areas_m2 / 1e6
+    dados_combinados['densidade_pop_km2'] = (
+        dados_combinados['TOTAL'].to_numpy() / areas_m2 * 1e6
+    )
     
     # Create improved colormap
     cmap = criar_colormap_melhorado()
@@ -339,23 +470,39 @@ def processar_todas_grades(area_geom, titulo, layers_poligonos, layers_para_most
     # Plot with improved settings
     fig, ax = plt.subplots(figsize=(fig_size, fig_size), dpi=150)
     
-    # Plot population density with improved colormap
-    dados_combinados.plot(
-        column='densidade_pop_km2',
-        ax=ax,
-        legend=True,
-        cmap=cmap,
+    # Plot population density as one PolyCollection built straight from the
+    # coordinate array: the grid cells are simple quads, so a single
+    # collection replaces the per-cell patch artists GeoSeries.plot creates
+    coords, cell_idx = shapely.get_coordinates(
+        dados_combinados.geometry.values, return_index=True
+    )
+    verts = np.split(coords, np.flatnonzero(np.diff(cell_idx)) + 1)
+
+    # Resolve every cell's color in one vectorized colormap lookup instead
+    # of letting matplotlib normalize and map values at draw time
+    densidade = dados_combinados['densidade_pop_km2'].to_numpy()
+    norm = Normalize(vmin=0, vmax=float(densidade.max()) or 1.0)  # escala a partir do zero
+    rgba = cmap(norm(densidade))
+
+    pc = PolyCollection(
+        verts,
+        facecolors=rgba,
         alpha=0.7,
         edgecolor='gray',
-        linewidth=0.15,
-        legend_kwds={
-            'shrink': 0.5, 
-            'label': 'Densidade Populacional (hab/km²)',
-            'orientation': 'vertical',
-            'pad': 0.02
-        },
-        vmin=0  # Garante que a escala começa do zero
+        linewidth=0.15
     )
+    ax.add_collection(pc, autolim=True)
+    ax.autoscale_view()
+
+    # Match GeoDataFrame.plot's aspect for geographic CRS: without this the
+    # axes stay at 'auto' and the circular buffers render as ellipses
+    miny, maxy = dados_combinados.total_bounds[[1, 3]]
+    ax.set_aspect(1 / np.cos(np.radians((miny + maxy) / 2)))
+
+    mappable = ScalarMappable(norm=norm, cmap=cmap)
+    mappable.set_array([])
+    cbar = fig.colorbar(mappable, ax=ax, shrink=0.5, pad=0.02, orientation='vertical')
+    cbar.set_label('Densidade Populacional (hab/km²)')
     
     # Draw boundaries
     desenhar_contornos(ax, layers_poligonos, layers_para_mostrar)
@@ -392,7 +539,7 @@ def processar_todas_grades(area_geom, titulo, layers_poligonos, layers_para_most
         print(f"⚠ Could not add basemap: {e}")
     
     # Statistics box with improved formatting
-    total_pessoas, area_km2, densidade_media, densidade_maxima = calcular_estatisticas(dados_area, area_geom)
+    total_pessoas, area_km2, densidade_media, densidade_maxima = calcular_estatisticas(dados_combinados, area_geom)
     
     info_texto = (
         f"ESTATÍSTICAS\n"
@@ -400,7 +547,7 @@ def processar_todas_grades(area_geom, titulo, layers_poligonos, layers_para_most
         f"Área do Polígono: {area_km2:.2f} km²\n"
         f"Densidade Média: {densidade_media:.2f} hab/km²\n"
         f"Densidade Máxima: {densidade_maxima:.2f} hab/km²"
-    ).replace(",", ".")
+    ).translate(_COMMA_DOT)
     
     ax.text(
         0.02, 0.02,
@@ -422,18 +569,36 @@ def processar_todas_grades(area_geom, titulo, layers_poligonos, layers_para_most
     
     plt.tight_layout()
     
-    if output_path:
-        plt.savefig(output_path, dpi=300, bbox_inches='tight', facecolor='white')
-        print(f"✓ Map saved: {output_path}")
-    
-    plt.close()
-    
-    return {
+    png_buffer = None
+    if output_path or return_png:
+        # dpi=200 renders a quarter of the pixels of the old dpi=300 and is
+        # indistinguishable at the 15cm the PDF embeds; compress_level=6 is
+        # zlib's speed/size sweet spot for the PNG encode. Rasterize once
+        # into memory, then the disk copy is a plain byte write.
+        png_buffer = io.BytesIO()
+        plt.savefig(png_buffer, format='png', dpi=200, bbox_inches='tight',
+                    facecolor='white', pil_kwargs={'compress_level': 6})
+        if output_path:
+            with open(output_path, 'wb') as f:
+                f.write(png_buffer.getbuffer())
+            print(f"✓ Map saved: {output_path}")
+        png_buffer.seek(0)
+
+    # Release the figure and the combined cells before returning: three of
+    # these passes run back to back and the frames are large in urban areas
+    plt.close(fig)
+    del dados_combinados, todos_dados, verts, coords, rgba
+    gc.collect()
+
+    stats = {
         'total_pessoas': total_pessoas,
         'area_km2': area_km2,
         'densidade_media': densidade_media,
         'densidade_maxima': densidade_maxima
     }
+    if return_png:
+        stats['png_buffer'] = png_buffer
+    return stats
 
 
 def analyze_population(kml_file, output_dir='results', buffer_info=None, height=None):
@@ -490,7 +655,26 @@ def analyze_population(kml_file, output_dir='results', buffer_info=None, height=
         return None
     
     results = {}
-    
+
+    # Adjacent Area is built 5km from CV, but analyzed area is between GRB
+    # and Adjacent Area; build the ring once, up front
+    area_anel = None
+    if 'Adjacent Area' in layers_poligonos and 'Ground Risk Buffer' in layers_poligonos:
+        area_anel = layers_poligonos['Adjacent Area'].difference(layers_poligonos['Ground Risk Buffer'])
+
+    # Resolve the quadrants for the union of all analyzed geometries once
+    # and prefetch them: the three per-layer passes then find every grade
+    # already in _GRID_CACHE instead of each downloading/loading its own
+    analysis_geoms = [
+        layers_poligonos[name]
+        for name in ('Flight Geography', 'Ground Risk Buffer')
+        if name in layers_poligonos
+    ]
+    if area_anel is not None:
+        analysis_geoms.append(area_anel)
+    if analysis_geoms:
+        prefetch_grids(identificar_grades_relevantes(shapely.unary_union(analysis_geoms)))
+
     # Plot 1 — Flight Geography
     stats = processar_todas_grades(
         area_geom=layers_poligonos['Flight Geography'],
@@ -516,9 +700,7 @@ def analyze_population(kml_file, output_dir='results', buffer_info=None, height=
         results['Ground Risk Buffer'] = stats
     
     # Plot 3 — Adjacent Area ring
-    # Adjacent Area is built 5km from CV, but analyzed area is between GRB and Adjacent Area
-    if 'Adjacent Area' in layers_poligonos and 'Ground Risk Buffer' in layers_poligonos:
-        area_anel = layers_poligonos['Adjacent Area'].difference(layers_poligonos['Ground Risk Buffer'])
+    if area_anel is not None:
         stats = processar_todas_grades(
             area_geom=area_anel,
             titulo="Densidade Populacional - Área Adjacente (SDO 50 V3)",